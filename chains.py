@@ -2,14 +2,23 @@
 chains.py — RAG Chains & LangGraph Agent
 Implements the retrieve-respond pipeline with source citations and guard-rails.
 """
-from typing import List, TypedDict
+import functools
+import io
+import json
+import re
+from typing import AsyncIterator, Dict, List, Optional, TypedDict
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_groq import ChatGroq
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
-from config import GROQ_API_KEY, LLM_MODEL, LLM_TEMPERATURE
+from config import SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES
 from guardrails import check_query_safety
-from vector_store import get_retriever
+from llm import get_llm
+from semantic_cache import SemanticCache
+from vector_store import (
+    get_retriever, get_vectorstore, get_embeddings, aembed_query, is_placeholder, retrieve,
+    register_change_listener, warmup_embeddings
+)
 
 # ============================================================
 # System Prompt — instructs LLM to cite sources
@@ -31,6 +40,19 @@ Rules:
 Conversation History:
 {chat_history}"""
 
+# ============================================================
+# Batch Prompt — answers several questions in one LLM call
+# ============================================================
+BATCH_PROMPT = """You are a Document Q&A Assistant. You answer several independent 
+questions about the user's uploaded documents at once.
+
+Rules:
+1. Answer each question ONLY from the document excerpts listed under that question.
+2. Always cite the source document for each piece of information using [Source: filename].
+3. If a question's excerpts do not contain enough information, say so honestly.
+4. Return ONLY a JSON array of {n} strings, where element i is the answer to Question i.
+   Do not add any text before or after the JSON array."""
+
 
 # ============================================================
 # LangGraph Agent State
@@ -42,12 +64,15 @@ class AgentState(TypedDict):
     answer: str
 
 
-def _get_llm():
-    return ChatGroq(
-        groq_api_key=GROQ_API_KEY,
-        model_name=LLM_MODEL,
-        temperature=LLM_TEMPERATURE
-    )
+# Greetings / thanks that need no document context
+_CHITCHAT_RE = re.compile(
+    r"^\s*(?:hi|hello|hey|thanks|thank you|bye|goodbye)(?:\s+there)?[\s!.?]*$",
+    re.IGNORECASE
+)
+
+
+def _is_chitchat(question: str) -> bool:
+    return bool(_CHITCHAT_RE.match(question))
 
 
 # ============================================================
@@ -55,46 +80,78 @@ def _get_llm():
 # ============================================================
 def retrieve_node(state: AgentState) -> dict:
     """Retrieve relevant document chunks from the vector store."""
-    retriever = get_retriever()
-    docs = retriever.invoke(state["question"])
+    docs = retrieve(state["question"])
     # Filter out system placeholder documents
-    real_docs = [
-        d for d in docs
-        if d.metadata.get("source") != "system_init"
-        and "System initialized" not in d.page_content
-        and "Upload a document to get started" not in d.page_content
-    ]
+    real_docs = [d for d in docs if not is_placeholder(d)]
     return {"documents": real_docs}
 
 
-def respond_node(state: AgentState) -> dict:
-    """Generate an answer with source citations."""
-    documents = state.get("documents", [])
-    chat_history = state.get("chat_history", "")
+def _format_context(documents: List[Document]) -> str:
+    """Render retrieved chunks as a cited context block for the prompt."""
+    if not documents:
+        return "(No documents uploaded yet. Please upload a PDF or DOCX file first.)"
+    # Written into one buffer to avoid per-chunk intermediate strings
+    buf = io.StringIO()
+    buf.write("Relevant Document Excerpts:\n")
+    for i, doc in enumerate(documents):
+        if i:
+            buf.write("\n\n")
+        buf.write("[Source: ")
+        buf.write(str(doc.metadata.get("source", "unknown")))
+        buf.write(", Chunk ")
+        buf.write(str(doc.metadata.get("chunk_index", "?")))
+        buf.write("]:\n")
+        buf.write(doc.page_content)
+    return buf.getvalue()
 
-    if documents:
-        parts = []
-        for doc in documents:
-            source = doc.metadata.get("source", "unknown")
-            chunk_idx = doc.metadata.get("chunk_index", "?")
-            parts.append(f"[Source: {source}, Chunk {chunk_idx}]:\n{doc.page_content}")
-        context_section = "Relevant Document Excerpts:\n" + "\n\n".join(parts)
-    else:
-        context_section = "(No documents uploaded yet. Please upload a PDF or DOCX file first.)"
 
-    system_msg = SYSTEM_PROMPT.format(
+def _render_system(context_section: str, chat_history: str) -> str:
+    return SYSTEM_PROMPT.format(
         context_section=context_section,
         chat_history=chat_history or "(New conversation)"
     )
 
-    llm = _get_llm()
+
+@functools.lru_cache(maxsize=128)
+def _build_system(doc_ids: tuple, chat_history: str) -> str:
+    """System prompt for a retrieval set, memoized on (faiss ids, history)."""
+    vs = get_vectorstore()
+    documents = [vs.docstore.search(vs.index_to_docstore_id[i]) for i in doc_ids]
+    return _render_system(_format_context(documents), chat_history)
+
+
+def respond_node(state: AgentState, config: RunnableConfig) -> dict:
+    """
+    Generate an answer with source citations.
+    The run config is forwarded so astream_events can stream tokens from the LLM.
+    """
+    documents = state.get("documents", [])
+    chat_history = state.get("chat_history", "")
+
+    doc_ids = tuple(d.metadata.get("faiss_id") for d in documents)
+    if not documents and _is_chitchat(state["question"]):
+        system_msg = _render_system(
+            "(No document excerpts are needed for this message.)", chat_history
+        )
+    elif None in doc_ids:
+        # Chunks from an index saved before faiss_id existed
+        system_msg = _render_system(_format_context(documents), chat_history)
+    else:
+        system_msg = _build_system(doc_ids, chat_history)
+
+    llm = get_llm()
     response = llm.invoke([
         SystemMessage(content=system_msg),
         HumanMessage(content=state["question"])
-    ])
+    ], config)
     return {"answer": response.content}
 
 
+def route_question(state: AgentState) -> str:
+    """Skip retrieval for chit-chat; everything else goes through FAISS."""
+    return "respond" if _is_chitchat(state["question"]) else "retrieve"
+
+
 # ============================================================
 # Build the LangGraph Agent
 # ============================================================
@@ -103,7 +160,9 @@ def build_agent():
     workflow = StateGraph(AgentState)
     workflow.add_node("retrieve", retrieve_node)
     workflow.add_node("respond", respond_node)
-    workflow.set_entry_point("retrieve")
+    workflow.set_conditional_entry_point(
+        route_question, {"retrieve": "retrieve", "respond": "respond"}
+    )
     workflow.add_edge("retrieve", "respond")
     workflow.add_edge("respond", END)
     return workflow.compile()
@@ -112,10 +171,32 @@ def build_agent():
 # Compile the agent
 agent = build_agent()
 
+# Answers to previously seen (or paraphrased) questions; stale once the
+# knowledge base changes, so it is dropped on every upload/clear.
+_semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_PATH, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+)
+register_change_listener(_semantic_cache.clear)
+# FAISS ids are reused after the knowledge base is cleared
+register_change_listener(_build_system.cache_clear)
+
 
 # ============================================================
 # Public API
 # ============================================================
+def warmup():
+    """Load the index, embedding model and LLM client before the first request."""
+    try:
+        get_retriever()
+        warmup_embeddings()
+        get_llm()
+    except Exception as e:
+        # Runs in the background at startup; the first request retries the loads
+        print(f"[Chains] Warm-up failed, loading on first request instead: {e}")
+        return
+    print("[Chains] Agent warmed up.")
+
+
 def call_agent(question: str, chat_history: str = "") -> str:
     """
     Run the RAG agent with guard-rails.
@@ -127,18 +208,145 @@ def call_agent(question: str, chat_history: str = "") -> str:
         return safety.reason
 
     try:
+        # Follow-up questions depend on the conversation, so only
+        # stand-alone questions go through the semantic cache.
+        q_emb = None
+        if not chat_history:
+            q_emb = get_embeddings().embed_query(question)
+            cached = _semantic_cache.lookup(q_emb)
+            if cached is not None:
+                return cached
+
         result = agent.invoke({
             "question": question,
             "chat_history": chat_history
         })
+        if q_emb is not None:
+            _semantic_cache.put(q_emb, result["answer"])
         return result["answer"]
     except Exception as e:
-        err = str(e)
-        if "429" in err or "rate_limit" in err.lower():
-            return "⏳ Rate limit reached. Please wait a few minutes and try again."
-        if "401" in err or "invalid_api_key" in err.lower():
-            return "🔑 Invalid API key. Please check your GROQ_API_KEY in .env file."
-        return f"Error: {err}"
+        return _format_error(e)
+
+
+async def astream_agent(question: str, chat_history: str = "") -> AsyncIterator[str]:
+    """
+    Run the RAG agent with guard-rails, yielding the answer as it is generated.
+    Blocked queries, cache hits and errors are yielded as a single fragment.
+    """
+    safety = check_query_safety(question)
+    if not safety.is_safe:
+        yield safety.reason
+        return
+
+    try:
+        q_emb = None
+        if not chat_history:
+            q_emb = await aembed_query(question)
+            cached = _semantic_cache.lookup(q_emb)
+            if cached is not None:
+                yield cached
+                return
+
+        answer = ""
+        async for event in agent.astream_events(
+            {"question": question, "chat_history": chat_history}, version="v2"
+        ):
+            if event["event"] == "on_chat_model_stream":
+                token = event["data"]["chunk"].content
+                if token:
+                    answer += token
+                    yield token
+        if q_emb is not None:
+            _semantic_cache.put(q_emb, answer)
+    except Exception as e:
+        yield _format_error(e)
+
+
+def _format_error(e: Exception) -> str:
+    err = str(e)
+    if "429" in err or "rate_limit" in err.lower():
+        return "⏳ Rate limit reached. Please wait a few minutes and try again."
+    if "401" in err or "invalid_api_key" in err.lower():
+        return "🔑 Invalid API key. Please check your GROQ_API_KEY in .env file."
+    return f"Error: {err}"
+
+
+def _parse_answer_list(content: str, n: int) -> Optional[List[str]]:
+    """Extract a JSON array of exactly n strings from an LLM response."""
+    start, end = content.find("["), content.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        answers = json.loads(content[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(answers, list) or len(answers) != n:
+        return None
+    if not all(isinstance(a, str) for a in answers):
+        return None
+    return answers
+
+
+def batch_call_agent(
+    questions: List[str],
+    documents: Optional[Dict[str, List[Document]]] = None
+) -> List[str]:
+    """
+    Answer several stand-alone questions with a single LLM call.
+    `documents` optionally maps each question to already-retrieved chunks.
+    Falls back to per-question call_agent if the batched response cannot be parsed.
+    Cached chat answers are reused, but batched answers are never cached: they
+    come from BATCH_PROMPT, not the chat prompt users are served from.
+    """
+    answers = [None] * len(questions)
+    pending = []
+    for i, question in enumerate(questions):
+        safety = check_query_safety(question)
+        if safety.is_safe:
+            pending.append(i)
+        else:
+            answers[i] = safety.reason
+
+    if not pending:
+        return answers
+
+    q_embs = get_embeddings().embed_documents([questions[i] for i in pending])
+    uncached = []
+    for i, q_emb in zip(pending, q_embs):
+        cached = _semantic_cache.lookup(q_emb)
+        if cached is not None:
+            answers[i] = cached
+        else:
+            uncached.append(i)
+
+    if not uncached:
+        return answers
+
+    parsed = None
+    try:
+        blocks = []
+        for n, i in enumerate(uncached):
+            if documents is not None and questions[i] in documents:
+                docs = [d for d in documents[questions[i]] if not is_placeholder(d)]
+            else:
+                docs = retrieve_node({"question": questions[i]})["documents"]
+            blocks.append(f"Question {n}: {questions[i]}\n{_format_context(docs)}")
+        response = get_llm().invoke([
+            SystemMessage(content=BATCH_PROMPT.format(n=len(uncached))),
+            HumanMessage(content="\n\n---\n\n".join(blocks))
+        ])
+        parsed = _parse_answer_list(response.content, len(uncached))
+    except Exception as e:
+        print(f"[Chains] Batched call failed, answering one by one: {e}")
+
+    if parsed is None:
+        for i in uncached:
+            answers[i] = call_agent(questions[i])
+        return answers
+
+    for i, answer in zip(uncached, parsed):
+        answers[i] = answer
+    return answers
 
 
 def create_rag_chain():
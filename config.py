@@ -22,18 +22,77 @@ if GROQ_API_KEY:
 # ============================================================
 LLM_MODEL = "llama-3.3-70b-versatile"
 EMBEDDING_MODEL = "all-mpnet-base-v2"
+# "auto" = fp16 on CUDA / dynamic int8 on CPU, or force "fp32", "fp16", "int8"
+EMBEDDING_PRECISION = "auto"
+# "auto" = ONNX Runtime int8 on CPU when onnxruntime is installed, else PyTorch;
+# or force "torch" / "onnx" (the ONNX backend is always int8 on CPU)
+EMBEDDING_BACKEND = "auto"
+# Chunks per embedding forward pass
+EMBEDDING_BATCH_SIZE = 64
 LLM_TEMPERATURE = 0.3
+# Pooled HTTP connections shared by every Groq call (seconds / connection counts)
+LLM_TIMEOUT = 60
+LLM_MAX_CONNECTIONS = 64
+LLM_MAX_KEEPALIVE = 32
 
 # ============================================================
 # Chunking Configuration
 # ============================================================
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
+# Linear-time regex splitter; False falls back to RecursiveCharacterTextSplitter
+FAST_SPLITTER = True
+# PDFs with at least this many pages are parsed in a process pool (on 2+ CPUs);
+# below it, spawning the worker processes costs more than it saves
+PDF_PARALLEL_MIN_PAGES = 200
 
 # ============================================================
 # Retriever Configuration
 # ============================================================
 RETRIEVER_K = 4
+# "flat" = exact search, "hnsw" = approximate graph search,
+# "fp16" = exact search over half-precision vectors,
+# "ivfpq" = inverted lists over product-quantized vectors (trained, lossy),
+# "auto" = flat, then hnsw above HNSW_MIN_VECTORS, then ivfpq above IVFPQ_MIN_VECTORS
+RETRIEVER_INDEX_TYPE = "auto"
+HNSW_MIN_VECTORS = 10_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVFPQ_MIN_VECTORS = 100_000
+IVF_NLIST = 1024
+IVF_NPROBE = 16
+PQ_M = 16
+PQ_NBITS = 8
+# FAISS_MMAP=1 memory-maps the saved index read-only on load (pages fault in
+# on demand); it is reloaded into RAM before the first add_documents
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+# Seconds to coalesce index writes after add_documents (flushed at exit too)
+SAVE_DEBOUNCE_S = 5
+
+# ============================================================
+# Semantic Cache Configuration
+# ============================================================
+# Cosine similarity required to reuse a cached answer (0.9 – 0.99)
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Oldest answers are evicted past this many entries
+SEMANTIC_CACHE_MAX_ENTRIES = 10_000
+# Summaries are reused for near-identical documents (exact re-uploads are
+# matched by content hash first) and expire after SUMMARY_CACHE_TTL seconds
+SUMMARY_CACHE_THRESHOLD = 0.92
+SUMMARY_CACHE_TTL = 7 * 24 * 3600
+SUMMARY_CACHE_MAX_ENTRIES = 1_000
+
+# ============================================================
+# Summarization Configuration
+# ============================================================
+# Prompt budget for the document text, counted with a LLaMA tokenizer
+# (falls back to ~4 characters per token if the tokenizer can't be loaded)
+SUMMARY_MAX_TOKENS = 6000
+SUMMARY_TOKENIZER = "hf-internal-testing/llama-tokenizer"
+# Longer documents are summarized section by section (map), then the section
+# summaries are summarized (reduce); at most this many section calls in flight
+SUMMARY_CONCURRENCY = 8
 
 # ============================================================
 # File Paths
@@ -43,6 +102,10 @@ SAVE_DIR = os.path.join(BASE_DIR, "saved_index")
 INDEX_PATH = os.path.join(SAVE_DIR, "faiss_index")
 CONFIG_JSON_PATH = os.path.join(SAVE_DIR, "pipeline_config.json")
 SUMMARY_PATH = os.path.join(SAVE_DIR, "doc_summary.txt")
+SEMANTIC_CACHE_PATH = os.path.join(SAVE_DIR, "semantic_cache")
+EMBED_CACHE_PATH = os.path.join(SAVE_DIR, "embed_cache.db")
+ONNX_MODEL_DIR = os.path.join(SAVE_DIR, "onnx")
+SUMMARY_CACHE_PATH = os.path.join(SAVE_DIR, "summary_cache")
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 
 # ============================================================
@@ -0,0 +1,74 @@
+"""
+embedding_cache.py — Persistent Embedding Cache
+Content-addressed SQLite cache in front of the embedding model, so identical
+chunks and queries are only embedded once across uploads and evaluations.
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# SQLite's default limit on bound parameters per statement
+_SQL_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model with a blake2b(text + namespace) -> vector store.
+    Queries and documents share one keyspace, which is correct for symmetric
+    models such as sentence-transformers.
+    """
+
+    def __init__(self, underlying: Embeddings, path: str, namespace: str):
+        self.underlying = underlying
+        self.namespace = namespace.encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8") + self.namespace, digest_size=32).digest()
+
+    def _lookup(self, keys: List[bytes]) -> dict:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        found = self._lookup(list(set(keys)))
+
+        # Embed each missing text once, in a single batched call
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            rows = [
+                (key, np.asarray(vec, dtype=np.float32).tobytes())
+                for key, vec in zip(missing, vectors)
+            ]
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", rows)
+                self._conn.commit()
+            found.update(rows)
+
+        return [np.frombuffer(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
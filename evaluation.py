@@ -6,12 +6,17 @@ Generates a markdown report with all metrics.
 import time
 import os
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from langchain_core.documents import Document
 from config import SAVE_DIR
-from vector_store import load_vectorstore, get_retriever, get_embeddings, add_documents
-from chains import call_agent
+from vector_store import (
+    load_vectorstore, get_embeddings, add_documents, batch_retrieve, is_placeholder,
+    get_vector_by_docid
+)
+from chains import batch_call_agent
 from guardrails import check_query_safety
 from ingestion import ingest_document
+from similarity import cosine_batch
 
 
 # ============================================================
@@ -37,6 +42,20 @@ SAMPLE_QUESTIONS = [
 ]
 
 
+def retrieve_questions(questions: List[str]) -> Tuple[Dict[str, List[Document]], Dict[str, float]]:
+    """
+    Single batched retrieval pass shared by the evaluations.
+    Returns ({question: docs}, {question: retrieval time in seconds}).
+    """
+    start = time.time()
+    retrieved = batch_retrieve(questions)
+    # One search for all questions, so report the amortized time per question
+    per_question = (time.time() - start) / max(len(questions), 1)
+    docs_by_q = dict(zip(questions, retrieved))
+    times_by_q = {q: per_question for q in questions}
+    return docs_by_q, times_by_q
+
+
 def evaluate_guardrails() -> Dict:
     """Test guard-rail effectiveness."""
     results = []
@@ -64,21 +83,22 @@ def evaluate_guardrails() -> Dict:
     }
 
 
-def evaluate_retrieval(questions: List[str] = None) -> Dict:
+def evaluate_retrieval(
+    questions: List[str] = None,
+    precomputed: Dict[str, List[Document]] = None,
+    retrieval_times: Dict[str, float] = None
+) -> Dict:
     """Test retrieval quality — measures if chunks are retrieved."""
     questions = questions or SAMPLE_QUESTIONS
     results = []
 
-    retriever = get_retriever()
-    for q in questions:
-        start = time.time()
-        docs = retriever.invoke(q)
-        elapsed = time.time() - start
+    if precomputed is None:
+        precomputed, retrieval_times = retrieve_questions(questions)
+    retrieval_times = retrieval_times or {}
 
-        real_docs = [
-            d for d in docs
-            if d.metadata.get("source") != "system_init"
-        ]
+    for q in questions:
+        real_docs = [d for d in precomputed[q] if not is_placeholder(d)]
+        elapsed = retrieval_times.get(q, 0.0)
 
         results.append({
             "question": q,
@@ -98,16 +118,21 @@ def evaluate_retrieval(questions: List[str] = None) -> Dict:
     }
 
 
-def evaluate_answers(questions: List[str] = None) -> Dict:
-    """Test answer quality — measures response time and answer presence."""
+def evaluate_answers(
+    questions: List[str] = None,
+    precomputed: Dict[str, List[Document]] = None
+) -> Dict:
+    """Test answer quality — measures batch response time and answer presence."""
     questions = questions or SAMPLE_QUESTIONS
     results = []
 
-    for q in questions:
-        start = time.time()
-        answer = call_agent(q)
-        elapsed = time.time() - start
+    # One batched LLM call for all questions, so there is no per-question latency;
+    # only the wall time of the whole batch is measured.
+    start = time.time()
+    answers = batch_call_agent(questions, documents=precomputed)
+    batch_time = time.time() - start
 
+    for q, answer in zip(questions, answers):
         has_citation = "[Source:" in answer or "[source:" in answer.lower()
         is_error = answer.startswith("Error:") or answer.startswith("⏳")
 
@@ -116,50 +141,55 @@ def evaluate_answers(questions: List[str] = None) -> Dict:
             "answer_length": len(answer),
             "has_citation": has_citation,
             "is_error": is_error,
-            "response_time_s": round(elapsed, 2),
             "answer_preview": answer[:200] + "..." if len(answer) > 200 else answer
         })
 
-    avg_time = np.mean([r["response_time_s"] for r in results])
     citation_rate = sum(1 for r in results if r["has_citation"]) / len(results) * 100
     error_rate = sum(1 for r in results if r["is_error"]) / len(results) * 100
 
     return {
         "total_questions": len(questions),
-        "avg_response_time_s": round(avg_time, 2),
+        "batch_response_time_s": round(batch_time, 2),
         "citation_rate_pct": round(citation_rate, 1),
         "error_rate_pct": round(error_rate, 1),
-        "under_5s_pct": round(
-            sum(1 for r in results if r["response_time_s"] < 5) / len(results) * 100, 1
-        ),
         "details": results
     }
 
 
-def evaluate_embedding_similarity(questions: List[str] = None) -> Dict:
+def evaluate_embedding_similarity(
+    questions: List[str] = None,
+    precomputed: Dict[str, List[Document]] = None
+) -> Dict:
     """Test semantic similarity between questions and retrieved chunks."""
     questions = questions or SAMPLE_QUESTIONS
     embeddings = get_embeddings()
-    retriever = get_retriever()
     results = []
 
-    for q in questions:
-        q_emb = embeddings.embed_query(q)
-        docs = retriever.invoke(q)
-        real_docs = [d for d in docs if d.metadata.get("source") != "system_init"]
+    if precomputed is None:
+        precomputed, _ = retrieve_questions(questions)
+    per_q_docs = [
+        [d for d in precomputed[q] if not is_placeholder(d)]
+        for q in questions
+    ]
+
+    # One batched forward pass for the questions; chunk vectors come straight
+    # from the FAISS index (older indexes without faiss_id are re-embedded).
+    all_docs = list({d.page_content: d for docs in per_q_docs for d in docs}.values())
+    doc_pos = {d.page_content: i for i, d in enumerate(all_docs)}
+    if all_docs:
+        q_embs = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+        if all("faiss_id" in d.metadata for d in all_docs):
+            d_embs = np.stack([get_vector_by_docid(d.metadata["faiss_id"]) for d in all_docs])
+        else:
+            d_embs = np.asarray(
+                embeddings.embed_documents([d.page_content for d in all_docs]),
+                dtype=np.float32
+            )
 
+    for i, (q, real_docs) in enumerate(zip(questions, per_q_docs)):
         if real_docs:
-            doc_texts = [d.page_content for d in real_docs]
-            doc_embs = embeddings.embed_documents(doc_texts)
-
-            similarities = []
-            for d_emb in doc_embs:
-                sim = np.dot(q_emb, d_emb) / (
-                    np.linalg.norm(q_emb) * np.linalg.norm(d_emb) + 1e-8
-                )
-                similarities.append(float(sim))
-
-            avg_sim = np.mean(similarities)
+            cols = [doc_pos[d.page_content] for d in real_docs]
+            avg_sim = float(np.mean(cosine_batch(d_embs[cols], q_embs[i])))
         else:
             avg_sim = 0.0
 
@@ -209,8 +239,8 @@ def generate_report(
 
     # Answers
     report += "## 4. Answer Quality\n\n"
-    report += f"- **Avg Response Time:** {answer_results['avg_response_time_s']} s\n"
-    report += f"- **Under 5s:** {answer_results['under_5s_pct']}%\n"
+    report += f"- **Batch Response Time:** {answer_results['batch_response_time_s']} s "
+    report += f"({answer_results['total_questions']} questions in one batched call)\n"
     report += f"- **Citation Rate:** {answer_results['citation_rate_pct']}%\n"
     report += f"- **Error Rate:** {answer_results['error_rate_pct']}%\n\n"
 
@@ -225,7 +255,7 @@ def generate_report(
     report += "---\n\n## 6. Conclusion\n\n"
     report += "The RAG pipeline demonstrates effective document retrieval and Q&A.\n"
     report += "Guard-rails successfully block prompt injection attempts.\n"
-    report += "Response times are within acceptable limits (<5s target).\n"
+    report += "Per-question latency is not measured here: answers are generated in one batched call.\n"
 
     return report
 
@@ -243,7 +273,7 @@ def run_full_evaluation(test_file: str = None) -> str:
     if test_file and os.path.exists(test_file):
         filename = os.path.basename(test_file)
         print(f"\n[Eval] Ingesting test file: {filename}")
-        chunks, _ = ingest_document(test_file, filename)
+        chunks = ingest_document(test_file, filename)
         add_documents(chunks)
 
     # Run evaluations
@@ -251,17 +281,20 @@ def run_full_evaluation(test_file: str = None) -> str:
     guardrail_results = evaluate_guardrails()
     print(f"  -> Accuracy: {guardrail_results['accuracy']}%")
 
+    # Retrieve once per question; shared by the three evaluations below
+    retrieved, retrieval_times = retrieve_questions(SAMPLE_QUESTIONS)
+
     print("\n[2/4] Testing retrieval...")
-    retrieval_results = evaluate_retrieval()
+    retrieval_results = evaluate_retrieval(SAMPLE_QUESTIONS, retrieved, retrieval_times)
     print(f"  -> Avg chunks: {retrieval_results['avg_chunks_retrieved']}")
 
     print("\n[3/4] Testing semantic similarity...")
-    similarity_results = evaluate_embedding_similarity()
+    similarity_results = evaluate_embedding_similarity(SAMPLE_QUESTIONS, retrieved)
     print(f"  -> Avg similarity: {similarity_results['avg_similarity']}")
 
     print("\n[4/4] Testing answer quality...")
-    answer_results = evaluate_answers()
-    print(f"  -> Avg response time: {answer_results['avg_response_time_s']}s")
+    answer_results = evaluate_answers(SAMPLE_QUESTIONS, retrieved)
+    print(f"  -> Batch response time: {answer_results['batch_response_time_s']}s")
 
     # Generate report
     report = generate_report(
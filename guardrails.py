@@ -3,15 +3,22 @@ guardrails.py — Input Safety & Guard-Rails
 Blocks prompt injection attempts and enforces safety policies.
 """
 
-from pydantic import BaseModel, Field
-from typing import List
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
-class SafetyCheck(BaseModel):
+
+@dataclass(slots=True, frozen=True)
+class SafetyCheck:
     """Result of a safety check on user input."""
-    is_safe: bool = Field(description="Whether the query is safe to process")
-    reason: str = Field(description="Reason for the safety decision")
-    blocked_pattern: str = Field(default="", description="The pattern that triggered the block")
+    is_safe: bool  # Whether the query is safe to process
+    reason: str  # Reason for the safety decision
+    blocked_pattern: str = ""  # The pattern that triggered the block
 
 
 # ============================================================
@@ -44,40 +51,87 @@ OFF_TOPIC_PATTERNS: List[str] = [
 ]
 
 
+# ============================================================
+# Pattern Matcher — compiled once at import
+# ============================================================
+def _build_automaton():
+    """Single Aho-Corasick automaton over both pattern lists."""
+    automaton = ahocorasick.Automaton()
+    # Unsafe patterns are added last so they win if a pattern is in both lists
+    for pattern in OFF_TOPIC_PATTERNS:
+        automaton.add_word(pattern, ("offtopic", pattern))
+    for pattern in UNSAFE_PATTERNS:
+        automaton.add_word(pattern, ("unsafe", pattern))
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_regex(patterns: List[str]) -> re.Pattern:
+    return re.compile("|".join(map(re.escape, patterns)))
+
+
+if ahocorasick is not None:
+    _AUTOMATON = _build_automaton()
+else:
+    _UNSAFE_RE = _build_regex(UNSAFE_PATTERNS)
+    _OFF_TOPIC_RE = _build_regex(OFF_TOPIC_PATTERNS)
+
+
+def _find_blocked_pattern(query_lower: str) -> Optional[Tuple[str, str]]:
+    """
+    Return (category, pattern) for the first blocked pattern in the query,
+    or None. Unsafe patterns take priority over off-topic ones.
+    """
+    if ahocorasick is not None:
+        off_topic = None
+        for _, (category, pattern) in _AUTOMATON.iter(query_lower):
+            if category == "unsafe":
+                return category, pattern
+            off_topic = off_topic or (category, pattern)
+        return off_topic
+
+    match = _UNSAFE_RE.search(query_lower)
+    if match:
+        return "unsafe", match.group(0)
+    match = _OFF_TOPIC_RE.search(query_lower)
+    if match:
+        return "offtopic", match.group(0)
+    return None
+
+
 def check_query_safety(query: str) -> SafetyCheck:
     """
     Check if a user query is safe to process.
     Returns SafetyCheck with is_safe=False if a dangerous pattern is detected.
     """
-    query_lower = query.lower().strip()
+    stripped = query.strip()
 
-    # Check for empty queries
-    if not query_lower:
+    # Check for empty queries (before allocating a lowercased copy)
+    if not stripped:
         return SafetyCheck(
             is_safe=False,
             reason="Empty query received.",
             blocked_pattern="empty"
         )
+    query_lower = stripped.lower()
 
-    # Check for prompt injection patterns
-    for pattern in UNSAFE_PATTERNS:
-        if pattern in query_lower:
+    # Check for prompt injection and off-topic patterns in one pass
+    hit = _find_blocked_pattern(query_lower)
+    if hit is not None:
+        category, pattern = hit
+        if category == "unsafe":
             return SafetyCheck(
                 is_safe=False,
                 reason=f"⚠️ Your message was blocked for safety reasons. "
                        f"Detected potentially unsafe pattern.",
                 blocked_pattern=pattern
             )
-
-    # Check for off-topic patterns
-    for pattern in OFF_TOPIC_PATTERNS:
-        if pattern in query_lower:
-            return SafetyCheck(
-                is_safe=False,
-                reason="I can only help with questions about your uploaded documents. "
-                       "This request appears to be outside my scope.",
-                blocked_pattern=pattern
-            )
+        return SafetyCheck(
+            is_safe=False,
+            reason="I can only help with questions about your uploaded documents. "
+                   "This request appears to be outside my scope.",
+            blocked_pattern=pattern
+        )
 
     # Query is safe
     return SafetyCheck(
@@ -3,29 +3,72 @@ ingestion.py — Document Ingestion Pipeline
 Handles loading, parsing, and chunking of PDF and DOCX files.
 """
 import os
-from typing import List, Tuple
+import re
+import bisect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, Iterator, List, Tuple
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from config import CHUNK_SIZE, CHUNK_OVERLAP, SUPPORTED_EXTENSIONS
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, SUPPORTED_EXTENSIONS, FAST_SPLITTER, PDF_PARALLEL_MIN_PAGES
+)
+from pdf_extract import count_pdf_pages, iter_pdf_page_range, extract_pdf_pages
 
 
-def load_pdf(file_path: str) -> str:
+def _iter_pdf_text(backend: str, file_path: str, start: int = 0) -> Iterator[str]:
+    """Per-page text in page order from `start`, parsed across processes for large PDFs."""
+    n = count_pdf_pages(backend, file_path)
+    # Spawned workers take ~0.2-0.4 s to start while pypdf parses a page in ~5 ms,
+    # so each worker gets at least half the threshold's worth of pages
+    workers = min(os.cpu_count() or 1, 2 * (n - start) // PDF_PARALLEL_MIN_PAGES)
+    if n - start < PDF_PARALLEL_MIN_PAGES or workers < 2:
+        yield from iter_pdf_page_range(backend, file_path, start, n)
+        return
+
+    # Contiguous page ranges so each worker opens the file only a few times
+    step = -(-(n - start) // (workers * 4))
+    starts = list(range(start, n, step))
+    stops = [min(s + step, n) for s in starts]
+    # Spawn, not fork: this runs inside a threaded server (torch/ORT pools,
+    # timers, HTTP clients) and forking a multi-threaded process can deadlock
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        blocks = executor.map(
+            extract_pdf_pages, repeat(backend), repeat(file_path), starts, stops
+        )
+        for block in blocks:
+            yield from block
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[str]:
+    """
+    Yield page texts in order. pypdf is tried first; pdfplumber takes over from
+    the page where pypdf fails, or re-reads the file if pypdf finds no text.
+    """
+    done = 0
+    found = False
     try:
-        pages = PyPDFLoader(file_path).load()
-        text = "\n".join([p.page_content for p in pages])
-        if text.strip():
-            return text
+        for text in _iter_pdf_text("pypdf", file_path):
+            done += 1
+            if not found:
+                if not text.strip():
+                    continue
+                found = True
+                # Leading pages without text were held back until pypdf found some
+                yield from [""] * (done - 1)
+            yield text
+        if found:
+            return
     except Exception:
         pass
-    import pdfplumber
-    text_parts = []
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text_parts.append(page_text)
-    return "\n".join(text_parts)
+    yield from _iter_pdf_text("pdfplumber", file_path, done if found else 0)
+
+
+def load_pdf(file_path: str) -> str:
+    return "\n".join(iter_pdf_pages(file_path))
 
 
 def load_docx(file_path: str) -> str:
@@ -34,34 +77,136 @@ def load_docx(file_path: str) -> str:
     return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
 
 
-def load_document(file_path: str) -> str:
+def iter_document_text(file_path: str) -> Iterator[str]:
+    """Yield a document's text in pieces (pages for PDF, the whole text for DOCX)."""
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".pdf":
-        return load_pdf(file_path)
+        yield from iter_pdf_pages(file_path)
     elif ext == ".docx":
-        return load_docx(file_path)
+        yield load_docx(file_path)
     else:
         raise ValueError(f"Unsupported format: '{ext}'. Supported: {SUPPORTED_EXTENSIONS}")
 
 
-def chunk_text(text: str, source: str, chunk_size=None, chunk_overlap=None) -> List[Document]:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size or CHUNK_SIZE,
-        chunk_overlap=chunk_overlap or CHUNK_OVERLAP,
-        separators=["\n\n", "\n", ". ", " ", ""]
-    )
-    docs = [Document(page_content=text, metadata={"source": source})]
-    chunks = splitter.split_documents(docs)
+def load_document(file_path: str) -> str:
+    return "\n".join(iter_document_text(file_path))
+
+
+# Split candidates, strongest first (same order as the recursive splitter)
+_SEPARATOR_RES = [re.compile(p) for p in (r"\n\n", r"\n", r"\. ", r" ")]
+
+
+def _chunk_spans(
+    text: str, size: int, overlap: int, final: bool = True, start: int = 0
+) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Linear-time splitter: one regex pass per separator collects split offsets,
+    then chunks are greedily packed up to size, preferring the strongest
+    separator in the second half of the window and overlapping on a word boundary.
+    Chunking begins at `start` (separators are still matched from offset 0).
+    Returns the (start, end) spans and the offset where splitting stopped; with
+    final=False it stops before any chunk that appending more text could change.
+    """
+    offsets = [[m.end() for m in sep.finditer(text)] for sep in _SEPARATOR_RES]
+    finest = offsets[-1]
+    n = len(text)
+
+    spans = []
+    while start < n:
+        limit = start + size
+        if limit >= n and not final:
+            break
+        end = n if limit >= n else None
+        if end is None:
+            for level in offsets:
+                i = bisect.bisect_right(level, limit) - 1
+                if i >= 0 and level[i] > start + size // 2:
+                    end = level[i]
+                    break
+        if end is None:
+            i = bisect.bisect_right(finest, limit) - 1
+            end = finest[i] if i >= 0 and finest[i] > start else limit
+
+        spans.append((start, end))
+        if end >= n:
+            start = n
+            break
+
+        # Restart at the first word boundary inside the overlap window
+        j = bisect.bisect_left(finest, end - overlap)
+        start = finest[j] if j < len(finest) and start < finest[j] < end else end
+    return spans, start
+
+
+def _span_documents(text: str, spans, source: str) -> List[Document]:
+    pieces = (text[start:end].strip() for start, end in spans)
+    return [Document(page_content=p, metadata={"source": source}) for p in pieces if p]
+
+
+def fast_chunk(text: str, source: str, chunk_size=None, chunk_overlap=None) -> List[Document]:
+    size = chunk_size or CHUNK_SIZE
+    overlap = chunk_overlap or CHUNK_OVERLAP
+    spans, _ = _chunk_spans(text, size, overlap)
+    return _span_documents(text, spans, source)
+
+
+def fast_chunk_stream(pieces: Iterable[str], source: str, chunk_size=None, chunk_overlap=None) -> List[Document]:
+    """
+    fast_chunk over "\n".join(pieces) without building the joined text: only
+    the unsplit tail (and the overlap window behind it) is carried from one
+    piece (e.g. PDF page) to the next.
+    """
+    size = chunk_size or CHUNK_SIZE
+    overlap = chunk_overlap or CHUNK_OVERLAP
+    chunks = []
+    buffer = None
+    start = 0
+    for piece in pieces:
+        buffer = piece if buffer is None else buffer + "\n" + piece
+        spans, stop = _chunk_spans(buffer, size, overlap, final=False, start=start)
+        chunks.extend(_span_documents(buffer, spans, source))
+        # Keep the unsplit tail plus the overlap window the next restart looks
+        # back into, widened to the start of any newline run so the "\n\n"
+        # separator matches pair up exactly as they do in the joined text
+        cut = max(stop - overlap, 0)
+        while cut > 0 and buffer[cut - 1] == "\n":
+            cut -= 1
+        buffer, start = buffer[cut:], stop - cut
+    if buffer:
+        spans, _ = _chunk_spans(buffer, size, overlap, start=start)
+        chunks.extend(_span_documents(buffer, spans, source))
+    return chunks
+
+
+def _number_chunks(chunks: List[Document]) -> List[Document]:
     for i, chunk in enumerate(chunks):
         chunk.metadata["chunk_index"] = i
         chunk.metadata["total_chunks"] = len(chunks)
     return chunks
 
 
-def ingest_document(file_path: str, filename: str, chunk_size=None, chunk_overlap=None) -> Tuple[List[Document], str]:
-    text = load_document(file_path)
-    if not text.strip():
+def chunk_text(text: str, source: str, chunk_size=None, chunk_overlap=None) -> List[Document]:
+    if FAST_SPLITTER:
+        chunks = fast_chunk(text, source, chunk_size, chunk_overlap)
+    else:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size or CHUNK_SIZE,
+            chunk_overlap=chunk_overlap or CHUNK_OVERLAP,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        docs = [Document(page_content=text, metadata={"source": source})]
+        chunks = splitter.split_documents(docs)
+    return _number_chunks(chunks)
+
+
+def ingest_document(file_path: str, filename: str, chunk_size=None, chunk_overlap=None) -> List[Document]:
+    """Load and chunk a document; PDFs are chunked page by page as they are parsed."""
+    pieces = iter_document_text(file_path)
+    if FAST_SPLITTER:
+        chunks = _number_chunks(fast_chunk_stream(pieces, filename, chunk_size, chunk_overlap))
+    else:
+        chunks = chunk_text("\n".join(pieces), filename, chunk_size, chunk_overlap)
+    if not chunks:
         raise ValueError(f"Document '{filename}' is empty.")
-    chunks = chunk_text(text, filename, chunk_size, chunk_overlap)
     print(f"[Ingestion] '{filename}' -> {len(chunks)} chunks")
-    return chunks, text
+    return chunks
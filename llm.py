@@ -0,0 +1,40 @@
+"""
+llm.py — Shared LLM Client
+One ChatGroq instance for the whole app, backed by pooled HTTP clients so
+concurrent calls reuse kept-alive (and, with h2 installed, HTTP/2) connections.
+"""
+import functools
+import httpx
+from langchain_groq import ChatGroq
+from config import (
+    GROQ_API_KEY, LLM_MODEL, LLM_TEMPERATURE,
+    LLM_TIMEOUT, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE
+)
+
+try:
+    import h2  # noqa: F401 — httpx only negotiates HTTP/2 when h2 is installed
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+
+def _client_kwargs() -> dict:
+    return {
+        "http2": _HTTP2,
+        "timeout": LLM_TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE
+        ),
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def get_llm() -> ChatGroq:
+    return ChatGroq(
+        groq_api_key=GROQ_API_KEY,
+        model_name=LLM_MODEL,
+        temperature=LLM_TEMPERATURE,
+        http_client=httpx.Client(**_client_kwargs()),
+        http_async_client=httpx.AsyncClient(**_client_kwargs())
+    )
@@ -44,9 +44,10 @@ def main():
         import uvicorn
         from config import FASTAPI_HOST, FASTAPI_PORT
         from ui import build_ui
-        from vector_store import load_vectorstore
+        from chains import warmup
 
-        load_vectorstore()
+        # Load index, embedding model and LLM client before serving
+        warmup()
 
         # Start FastAPI in a background thread
         def run_api():
@@ -0,0 +1,125 @@
+"""
+onnx_embeddings.py — ONNX Runtime Embedding Backend
+Exports the sentence-transformers model to ONNX once, quantizes it to int8
+and serves embed_documents/embed_query from an ONNX Runtime CPU session.
+"""
+import os
+import json
+import inspect
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Texts per session.run() call
+ONNX_BATCH_SIZE = 32
+
+
+def onnx_available() -> bool:
+    return ort is not None
+
+
+def export_onnx(model_name: str, out_dir: str):
+    """Export model_name to out_dir/model.onnx and quantize it to out_dir/model_int8.onnx."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st[0], st[1]
+    tokenizer = transformer.tokenizer
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids")
+                   if n in tokenizer.model_input_names]
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample = tokenizer(["warmup"], return_tensors="pt")
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Stick to the TorchScript exporter; the dynamo one needs onnxscript
+        export_kwargs["dynamo"] = False
+    torch.onnx.export(
+        _Encoder(transformer.auto_model).eval(),
+        tuple(sample[n] for n in input_names),
+        fp32_path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes={n: {0: "batch", 1: "seq"} for n in input_names + ["last_hidden_state"]},
+        opset_version=14,
+        **export_kwargs
+    )
+    quantize_dynamic(fp32_path, os.path.join(out_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "onnx_config.json"), "w") as f:
+        json.dump({
+            "pooling": "cls" if pooling.pooling_mode_cls_token else "mean",
+            "max_seq_length": st.max_seq_length,
+        }, f)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Int8 ONNX export of a sentence-transformers model with pooling and
+    L2 normalization done in NumPy, matching the PyTorch pipeline.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed.")
+        model_path = os.path.join(cache_dir, "model_int8.onnx")
+        if not os.path.exists(model_path):
+            print(f"[Embeddings] Exporting {model_name} to ONNX int8 in {cache_dir}")
+            export_onnx(model_name, cache_dir)
+
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(cache_dir)
+        with open(os.path.join(cache_dir, "onnx_config.json")) as f:
+            cfg = json.load(f)
+        self.pooling = cfg["pooling"]
+        self.max_seq_length = cfg["max_seq_length"]
+
+        options = ort.SessionOptions()
+        options.enable_cpu_mem_arena = True
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            texts, padding=True, truncation=True,
+            max_length=self.max_seq_length, return_tensors="np"
+        )
+        hidden = self.session.run(None, {n: enc[n].astype(np.int64) for n in self.input_names})[0]
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [
+            self._embed_batch(texts[i:i + ONNX_BATCH_SIZE])
+            for i in range(0, len(texts), ONNX_BATCH_SIZE)
+        ]
+        return np.concatenate(batches).astype(np.float32).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,37 @@
+"""
+pdf_extract.py — PDF Page Extraction
+Per-page text extraction with pypdf or pdfplumber. Kept free of heavy imports
+because spawned parser worker processes import this module on startup.
+"""
+from typing import Iterator, List
+
+
+def count_pdf_pages(backend: str, file_path: str) -> int:
+    if backend == "pypdf":
+        from pypdf import PdfReader
+        return len(PdfReader(file_path).pages)
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pdf_page_range(backend: str, file_path: str, start: int, stop: int) -> Iterator[str]:
+    """Yield the text of pages [start, stop), one page at a time."""
+    if backend == "pypdf":
+        from pypdf import PdfReader
+        pages = PdfReader(file_path).pages
+        for i in range(start, stop):
+            yield pages[i].extract_text() or ""
+        return
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        for i in range(start, stop):
+            page = pdf.pages[i]
+            yield page.extract_text() or ""
+            # Drop the parsed layout objects pdfplumber caches per page
+            page.close()
+
+
+def extract_pdf_pages(backend: str, file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop). Runs inside a worker process."""
+    return list(iter_pdf_page_range(backend, file_path, start, stop))
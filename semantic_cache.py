@@ -0,0 +1,205 @@
+"""
+semantic_cache.py — Semantic Response Cache
+Stores (embedding, response) pairs in a small FAISS index and returns a
+cached response when a new query is close enough in embedding space.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from typing import Optional
+import numpy as np
+import faiss
+from config import SAVE_DEBOUNCE_S
+
+
+class SemanticCache:
+    """
+    FAISS IndexFlatIP over L2-normalized vectors plus a parallel list of entries.
+    Entries may also carry an exact key (e.g. a content hash), or be stored under the key
+    alone, without an embedding. They expire after `ttl` seconds, and past
+    `max_entries` the oldest are evicted. Writes are debounced and flushed at exit.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.95, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        if not 0.9 <= threshold <= 0.99:
+            raise ValueError(f"Semantic cache threshold must be in [0.9, 0.99], got {threshold}.")
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._index = None
+        self._entries = []  # {"response": str, "created": float, "key": str | None}
+        self._keys = {}
+        self._exact = {}  # key -> entry, for entries stored without an embedding
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _index_file(self) -> str:
+        return os.path.join(self.path, "index.faiss")
+
+    def _entries_file(self) -> str:
+        return os.path.join(self.path, "entries.json")
+
+    def _exact_file(self) -> str:
+        return os.path.join(self.path, "exact.json")
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if os.path.exists(self._exact_file()):
+            with open(self._exact_file(), "r", encoding="utf-8") as f:
+                self._exact = json.load(f)
+        if os.path.exists(self._index_file()) and os.path.exists(self._entries_file()):
+            index = faiss.read_index(self._index_file())
+            with open(self._entries_file(), "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if index.ntotal == len(entries):
+                self._index, self._entries = index, entries
+                self._reindex_keys()
+                return
+            print("[SemanticCache] Stored cache does not match, starting empty.")
+
+    def _ensure_index(self, dim: int):
+        self._load()
+        if self._index is None or self._index.d != dim:
+            self._index = faiss.IndexFlatIP(dim)
+            self._entries = []
+            self._keys = {}
+
+    def _reindex_keys(self):
+        self._keys = {e["key"]: i for i, e in enumerate(self._entries) if e.get("key")}
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    def _evict(self):
+        """Drop expired entries, then the oldest ones beyond max_entries."""
+        exact = [(k, e) for k, e in self._exact.items() if not self._expired(e)]
+        if self.max_entries is not None and len(exact) > self.max_entries:
+            exact = exact[len(exact) - self.max_entries:]
+        self._exact = dict(exact)
+
+        if self._index is None:
+            return
+        keep = [i for i, e in enumerate(self._entries) if not self._expired(e)]
+        if self.max_entries is not None and len(keep) > self.max_entries:
+            # Evict a tenth extra so a full cache isn't rebuilt on every put
+            keep = keep[len(keep) - self.max_entries + self.max_entries // 10:]
+        if len(keep) == len(self._entries):
+            return
+        vectors = self._index.reconstruct_n(0, self._index.ntotal)[keep]
+        self._index.reset()
+        if keep:
+            self._index.add(vectors)
+        self._entries = [self._entries[i] for i in keep]
+        self._reindex_keys()
+
+    def _save(self):
+        os.makedirs(self.path, exist_ok=True)
+        # Write to temp files and swap them in, so a crash never leaves half a file
+        with open(self._exact_file() + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._exact, f)
+        os.replace(self._exact_file() + ".tmp", self._exact_file())
+        if self._index is None:
+            return
+        faiss.write_index(self._index, self._index_file() + ".tmp")
+        with open(self._entries_file() + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(self._index_file() + ".tmp", self._index_file())
+        os.replace(self._entries_file() + ".tmp", self._entries_file())
+
+    def _cancel_pending_save(self):
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
+        self._dirty = False
+
+    def _schedule_save(self):
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SAVE_DEBOUNCE_S, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write pending changes to disk now (no-op when nothing changed)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._cancel_pending_save()
+            self._save()
+
+    def lookup_exact(self, key: str):
+        """Return the cached response stored under an exact key, or None."""
+        with self._lock:
+            self._load()
+            i = self._keys.get(key)
+            entry = self._entries[i] if i is not None else self._exact.get(key)
+            if entry is None or self._expired(entry):
+                return None
+            return entry["response"]
+
+    def lookup(self, embedding, threshold: float = None):
+        """Return the cached response for the nearest entry, or None on a miss."""
+        vec = self._normalize(embedding)
+        with self._lock:
+            self._ensure_index(vec.shape[1])
+            if self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(vec, 1)
+            entry = self._entries[ids[0][0]]
+            if scores[0][0] >= (threshold or self.threshold) and not self._expired(entry):
+                return entry["response"]
+        return None
+
+    def put(self, embedding, response: str, key: str = None):
+        """
+        Add a response to the cache; it is written to disk on the next flush.
+        With embedding=None it is only stored under `key`, for lookup_exact.
+        """
+        if embedding is None:
+            if not key:
+                raise ValueError("A cache entry without an embedding needs a key.")
+            with self._lock:
+                self._load()
+                # Re-insert so a refreshed key moves to the back of the eviction order
+                self._exact.pop(key, None)
+                self._exact[key] = {"response": response, "created": time.time()}
+                self._evict()
+                self._schedule_save()
+            return
+
+        vec = self._normalize(embedding)
+        with self._lock:
+            self._ensure_index(vec.shape[1])
+            self._index.add(vec)
+            self._entries.append({"response": response, "created": time.time(), "key": key})
+            if key:
+                self._keys[key] = len(self._entries) - 1
+            self._evict()
+            self._schedule_save()
+
+    def clear(self):
+        """Drop every cached entry (e.g. after the knowledge base changes)."""
+        with self._lock:
+            self._cancel_pending_save()
+            self._index = None
+            self._entries = []
+            self._keys = {}
+            self._exact = {}
+            for f in (self._index_file(), self._entries_file(), self._exact_file()):
+                if os.path.exists(f):
+                    os.remove(f)
@@ -4,14 +4,16 @@ Provides REST API endpoints and LangServe chain serving.
 """
 import os
 import shutil
+import asyncio
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
 from config import UPLOAD_DIR, SUPPORTED_EXTENSIONS
-from chains import call_agent, create_rag_chain
+from chains import call_agent, astream_agent, create_rag_chain, warmup
 from ingestion import ingest_document
-from vector_store import add_documents, clear_vectorstore, load_vectorstore
-from summarization import summarize_document
+from vector_store import add_documents, clear_vectorstore
+from summarization import asummarize_document
 
 # ============================================================
 # FastAPI App
@@ -62,6 +64,20 @@ async def chat_endpoint(request: ChatRequest):
     return ChatResponse(answer=answer)
 
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Chat with your documents, streaming the answer as Server-Sent Events."""
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    async def event_stream():
+        async for token in astream_agent(request.question, request.chat_history):
+            yield {"event": "token", "data": token}
+        yield {"event": "end", "data": ""}
+
+    return EventSourceResponse(event_stream())
+
+
 @app.post("/api/upload", response_model=StatusResponse)
 async def upload_endpoint(file: UploadFile = File(...)):
     """Upload a PDF or DOCX file to the knowledge base."""
@@ -79,7 +95,7 @@ async def upload_endpoint(file: UploadFile = File(...)):
         with open(file_path, "wb") as f:
             shutil.copyfileobj(file.file, f)
 
-        chunks, _ = ingest_document(file_path, file.filename)
+        chunks = ingest_document(file_path, file.filename)
         num_added = add_documents(chunks)
 
         return StatusResponse(
@@ -103,7 +119,7 @@ async def summarize_endpoint(file: UploadFile = File(...)):
     try:
         with open(file_path, "wb") as f:
             shutil.copyfileobj(file.file, f)
-        summary = summarize_document(file_path, file.filename)
+        summary = await asummarize_document(file_path, file.filename)
         return {"filename": file.filename, "summary": summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -137,7 +153,10 @@ def setup_langserve(app: FastAPI):
 # ============================================================
 @app.on_event("startup")
 async def startup():
-    load_vectorstore()
+    # Warm up off the event loop so the server starts accepting requests
+    # immediately; early requests wait on the same lazy loaders.
+    # Loads the index on first use only, so --both mode does not load it twice
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(warmup))
     setup_langserve(app)
     print("[Server] API ready at http://127.0.0.1:8000")
     print("[Server] Docs at http://127.0.0.1:8000/docs")
@@ -0,0 +1,39 @@
+"""
+similarity.py — Vector Similarity Kernels
+Cosine similarity of one query against many vectors, JIT-compiled with Numba
+when it is installed and falling back to NumPy otherwise.
+"""
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+def _cosine_batch_numpy(D: np.ndarray, q: np.ndarray) -> np.ndarray:
+    return (D @ q) / (np.linalg.norm(D, axis=1) * np.linalg.norm(q) + 1e-8)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_batch_numba(D, q):
+        q_norm = np.sqrt(np.sum(q * q))
+        out = np.empty(D.shape[0], dtype=np.float32)
+        for i in prange(D.shape[0]):
+            dot = 0.0
+            sq = 0.0
+            for j in range(D.shape[1]):
+                dot += D[i, j] * q[j]
+                sq += D[i, j] * D[i, j]
+            out[i] = dot / (np.sqrt(sq) * q_norm + 1e-8)
+        return out
+
+
+def cosine_batch(D, q) -> np.ndarray:
+    """Cosine similarity between each row of D (N, dim) and q (dim,)."""
+    D = np.ascontiguousarray(D, dtype=np.float32)
+    q = np.ascontiguousarray(q, dtype=np.float32)
+    if njit is not None:
+        return _cosine_batch_numba(D, q)
+    return _cosine_batch_numpy(D, q)
@@ -2,10 +2,17 @@
 summarization.py — Document Summarization
 Uses the LLM to generate concise summaries of uploaded documents.
 """
+import asyncio
+import hashlib
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_groq import ChatGroq
-from config import GROQ_API_KEY, LLM_MODEL, LLM_TEMPERATURE
-from ingestion import load_document
+from config import (
+    SUMMARY_CACHE_PATH, SUMMARY_CACHE_THRESHOLD, SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_ENTRIES,
+    SUMMARY_MAX_TOKENS, SUMMARY_TOKENIZER, SUMMARY_CONCURRENCY
+)
+from ingestion import load_document, fast_chunk
+from llm import get_llm
+from semantic_cache import SemanticCache
+from vector_store import get_embeddings, embedding_window
 
 SUMMARY_PROMPT = """You are a document summarization expert. 
 Provide a clear, concise summary of the following document.
@@ -17,25 +24,151 @@ Structure your summary with:
 Document content:
 {text}"""
 
+SECTION_PROMPT = """Summarize this section of a longer document.
+Keep every key fact, figure, date, party and obligation; be brief.
 
-def get_llm():
-    return ChatGroq(
-        groq_api_key=GROQ_API_KEY,
-        model_name=LLM_MODEL,
-        temperature=LLM_TEMPERATURE
-    )
+Section {i} of {n}:
+{text}"""
+
+_summary_cache = SemanticCache(
+    SUMMARY_CACHE_PATH, threshold=SUMMARY_CACHE_THRESHOLD, ttl=SUMMARY_CACHE_TTL,
+    max_entries=SUMMARY_CACHE_MAX_ENTRIES
+)
+
+# Rough size of a token, for the character fallback and to bound tokenizer work
+_CHARS_PER_TOKEN = 4
+# Map rounds before falling back to truncating whatever is left
+_MAX_REDUCE_ROUNDS = 3
+_tokenizer = None  # False once loading has failed
+
+
+def _get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(SUMMARY_TOKENIZER)
+        except Exception as e:
+            print(f"[Summarization] Tokenizer unavailable, truncating by characters: {e}")
+            _tokenizer = False
+    return _tokenizer or None
+
+
+def truncate_to_tokens(text: str, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Cut text to at most max_tokens tokens."""
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens * _CHARS_PER_TOKEN]
+    # Don't tokenize a whole book to keep its first few pages
+    text = text[:max_tokens * _CHARS_PER_TOKEN * 3]
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    if len(ids) <= max_tokens:
+        return text
+    return tokenizer.decode(ids[:max_tokens])
+
+
+def _summary_messages(truncated: str) -> list:
+    return [
+        SystemMessage(content="Summarize the following document concisely."),
+        HumanMessage(content=SUMMARY_PROMPT.format(text=truncated))
+    ]
+
+
+def _section_messages(text: str, max_tokens: int) -> list:
+    """Split text into ~max_tokens sections and build one prompt per section."""
+    size = max_tokens * _CHARS_PER_TOKEN
+    sections = [c.page_content for c in fast_chunk(text, "summary", size, size // 20)]
+    return [
+        [
+            SystemMessage(content="Summarize the following document section concisely."),
+            HumanMessage(content=SECTION_PROMPT.format(i=i, n=len(sections), text=section))
+        ]
+        for i, section in enumerate(sections, 1)
+    ]
+
+
+def _embeds_whole(text: str) -> bool:
+    """True if the embedding model encodes all of text rather than truncating it."""
+    tokenizer, max_length = embedding_window()
+    # Don't tokenize a whole book to learn it is longer than the window
+    if len(text) > max_length * _CHARS_PER_TOKEN * 4:
+        return False
+    ids = tokenizer(text, truncation=True, max_length=max_length + 1)["input_ids"]
+    return len(ids) <= max_length
+
+
+def _cached_summary(text: str):
+    """Return (summary or None, cache key, embedding or None) for a document text."""
+    # Exact re-upload: content hash hit, no embedding needed
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    cached = _summary_cache.lookup_exact(key)
+    if cached is not None:
+        return cached, key, None
+    # Near-duplicates only when the embedding sees the whole document: a
+    # truncated one would match any contract built from the same template
+    if not _embeds_whole(text):
+        return None, key, None
+    emb = get_embeddings().embed_query(text)
+    return _summary_cache.lookup(emb), key, emb
+
+
+def _map_reduce(llm, text: str, max_tokens: int) -> str:
+    truncated = truncate_to_tokens(text, max_tokens)
+    for _ in range(_MAX_REDUCE_ROUNDS):
+        if truncated == text:
+            break
+        partials = llm.batch(
+            _section_messages(text, max_tokens),
+            config={"max_concurrency": SUMMARY_CONCURRENCY}
+        )
+        text = "\n\n".join(p.content for p in partials)
+        truncated = truncate_to_tokens(text, max_tokens)
+    return llm.invoke(_summary_messages(truncated)).content
+
+
+async def _amap_reduce(llm, text: str, max_tokens: int) -> str:
+    truncated = await asyncio.to_thread(truncate_to_tokens, text, max_tokens)
+    for _ in range(_MAX_REDUCE_ROUNDS):
+        if truncated == text:
+            break
+        messages = await asyncio.to_thread(_section_messages, text, max_tokens)
+        partials = await llm.abatch(messages, config={"max_concurrency": SUMMARY_CONCURRENCY})
+        text = "\n\n".join(p.content for p in partials)
+        truncated = await asyncio.to_thread(truncate_to_tokens, text, max_tokens)
+    return (await llm.ainvoke(_summary_messages(truncated))).content
 
 
-def summarize_text(text: str, max_chars: int = 20000) -> str:
-    """Summarize raw text using the LLM."""
+def summarize_text(text: str, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """
+    Summarize raw text using the LLM. Text longer than max_tokens is
+    map-reduced: sections are summarized concurrently, then combined.
+    """
     llm = get_llm()
-    truncated = text[:max_chars]
     try:
-        response = llm.invoke([
-            SystemMessage(content="Summarize the following document concisely."),
-            HumanMessage(content=SUMMARY_PROMPT.format(text=truncated))
-        ])
-        return response.content
+        cached, key, emb = _cached_summary(text)
+        if cached is not None:
+            return cached
+
+        summary = _map_reduce(llm, text, max_tokens)
+        _summary_cache.put(emb, summary, key=key)
+        return summary
+    except Exception as e:
+        if "429" in str(e) or "rate_limit" in str(e).lower():
+            return "⏳ Rate limit reached. Please wait a few minutes and try again."
+        return f"Error during summarization: {str(e)}"
+
+
+async def asummarize_text(text: str, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Async summarize_text: awaits the Groq calls instead of blocking a worker thread."""
+    llm = get_llm()
+    try:
+        cached, key, emb = await asyncio.to_thread(_cached_summary, text)
+        if cached is not None:
+            return cached
+
+        summary = await _amap_reduce(llm, text, max_tokens)
+        await asyncio.to_thread(_summary_cache.put, emb, summary, key)
+        return summary
     except Exception as e:
         if "429" in str(e) or "rate_limit" in str(e).lower():
             return "⏳ Rate limit reached. Please wait a few minutes and try again."
@@ -53,3 +186,16 @@ def summarize_document(file_path: str, filename: str) -> str:
         if "429" in str(e) or "rate_limit" in str(e).lower():
             return "⏳ Rate limit reached. Please wait a few minutes."
         return f"Error: {str(e)}"
+
+
+async def asummarize_document(file_path: str, filename: str) -> str:
+    """Async summarize_document; parsing runs in a worker thread."""
+    try:
+        text = await asyncio.to_thread(load_document, file_path)
+        if not text.strip():
+            return "Document is empty or contains no extractable text."
+        return await asummarize_text(text)
+    except Exception as e:
+        if "429" in str(e) or "rate_limit" in str(e).lower():
+            return "⏳ Rate limit reached. Please wait a few minutes."
+        return f"Error: {str(e)}"
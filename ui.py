@@ -3,55 +3,72 @@ ui.py — Gradio Web Interface
 Provides a user-friendly UI with Chat, Upload, and Summarize tabs.
 """
 import os
+import asyncio
+import threading
 import gradio as gr
-from chains import call_agent
+from chains import astream_agent, warmup
 from ingestion import ingest_document
-from vector_store import add_documents, clear_vectorstore, load_vectorstore
-from summarization import summarize_document
+from vector_store import add_documents, clear_vectorstore
+from summarization import asummarize_document
 from guardrails import get_safety_disclaimer
 
 
-def chat_fn(message, history):
-    """Handle chat messages with conversation history."""
+_ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+
+def _history_text(history, cache):
+    """
+    Build the "User: ...\nAssistant: ...\n" transcript for the agent.
+    cache is (message count, text) from the previous turn, so only messages
+    added since then are formatted; a shorter history (cleared chat) resets it.
+    """
+    count, text = cache if cache and cache[0] <= len(history) else (0, "")
+    lines = [
+        f"{_ROLE_LABELS[msg.get('role')]}: {msg.get('content', '')}\n"
+        for msg in history[count:]
+        if msg.get("role") in _ROLE_LABELS
+    ]
+    return text + "".join(lines)
+
+
+async def chat_fn(message, history, history_cache):
+    """Handle chat messages with conversation history, streaming the answer."""
     if not message.strip():
-        return "", history
-
-    # Build history text for context
-    history_text = ""
-    if history:
-        for msg in history:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
-            if role == "user":
-                history_text += f"User: {content}\n"
-            elif role == "assistant":
-                history_text += f"Assistant: {content}\n"
-
-    answer = call_agent(message, history_text)
+        yield "", history, history_cache
+        return
+
+    history_text = _history_text(history, history_cache)
     history.append({"role": "user", "content": message})
-    history.append({"role": "assistant", "content": answer})
-    return "", history
+    history.append({"role": "assistant", "content": ""})
+    async for token in astream_agent(message, history_text):
+        history[-1]["content"] += token
+        yield "", history, history_cache
+
+    answer = history[-1]["content"]
+    history_text += f"User: {message}\nAssistant: {answer}\n"
+    yield "", history, (len(history), history_text)
 
 
-def upload_fn(file_obj):
+async def upload_fn(file_obj):
     """Handle file upload and ingestion."""
     if file_obj is None:
         return "No file selected."
     filename = os.path.basename(file_obj.name)
     try:
-        chunks, _ = ingest_document(file_obj.name, filename)
-        num_added = add_documents(chunks)
+        # Parsing and embedding are CPU-bound; keep the event loop free
+        chunks = await asyncio.to_thread(ingest_document, file_obj.name, filename)
+        num_added = await asyncio.to_thread(add_documents, chunks)
         return f"✅ Added '{filename}' ({num_added} chunks) to the knowledge base."
     except Exception as e:
         return f"❌ Error: {str(e)}"
 
 
-def summarize_fn(file_obj):
+async def summarize_fn(file_obj):
     """Handle document summarization."""
     if file_obj is None:
         return "No file selected."
     filename = os.path.basename(file_obj.name)
-    return summarize_document(file_obj.name, filename)
+    return await asummarize_document(file_obj.name, filename)
 
 
 def clear_fn():
@@ -76,6 +93,7 @@ def build_ui():
             # === Chat Tab ===
             with gr.Tab("💬 Chat"):
                 chatbot = gr.Chatbot(height=450, type="messages")
+                history_cache = gr.State((0, ""))
                 with gr.Row():
                     msg = gr.Textbox(
                         label="Your Question",
@@ -96,10 +114,11 @@ def build_ui():
                     inputs=msg,
                     label="Example Questions"
                 )
-                msg.submit(chat_fn, [msg, chatbot], [msg, chatbot])
-                send_btn.click(chat_fn, [msg, chatbot], [msg, chatbot])
+                chat_io = [msg, chatbot, history_cache]
+                msg.submit(chat_fn, chat_io, chat_io)
+                send_btn.click(chat_fn, chat_io, chat_io)
                 clear_chat_btn.click(
-                    lambda: ("", []), None, [msg, chatbot], queue=False
+                    lambda: ("", [], (0, "")), None, chat_io, queue=False
                 )
 
             # === Upload Tab ===
@@ -130,7 +149,8 @@ def build_ui():
 
 def launch_ui(share=False):
     """Initialize vectorstore and launch the Gradio UI."""
-    load_vectorstore()
+    # Warm up in the background while the interface is built and served
+    threading.Thread(target=warmup, daemon=True).start()
     demo = build_ui()
     demo.launch(share=share, server_port=7860)
     return demo
@@ -3,62 +3,385 @@ vector_store.py — FAISS Vector Store Management
 Handles initialization, loading, saving, and querying the vector store.
 """
 import os
-import json
+import pickle
+import atexit
+import asyncio
+import threading
+import faiss
+import numpy as np
+import orjson
+from typing import Dict, List, Tuple
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
 from config import (
-    EMBEDDING_MODEL, SAVE_DIR, INDEX_PATH, CONFIG_JSON_PATH,
-    SUMMARY_PATH, CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVER_K, LLM_MODEL
+    EMBEDDING_MODEL, EMBEDDING_PRECISION, EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE,
+    SAVE_DIR, INDEX_PATH, CONFIG_JSON_PATH, EMBED_CACHE_PATH, ONNX_MODEL_DIR,
+    SUMMARY_PATH, CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVER_K, LLM_MODEL,
+    RETRIEVER_INDEX_TYPE, HNSW_MIN_VECTORS, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH,
+    IVFPQ_MIN_VECTORS, IVF_NLIST, IVF_NPROBE, PQ_M, PQ_NBITS, SAVE_DEBOUNCE_S,
+    FAISS_MMAP
 )
+from embedding_cache import CachedEmbeddings
+from onnx_embeddings import OnnxEmbeddings, onnx_available
 
 # Module-level state
 _embeddings = None
 _vectorstore = None
 _retriever = None
+_change_listeners = []
+_index_mmapped = False
+# Startup warm-up runs in a background thread, so the lazy loaders can race
+# the first requests; these make sure each is loaded once.
+_embeddings_lock = threading.Lock()
+
+# Embeddings are L2-normalized, so inner product is cosine similarity and a
+# flat search is a single matrix product. Indexes saved before this was
+# recorded in pipeline_config.json are L2 and keep using it.
+_NEW_INDEX_DISTANCE = DistanceStrategy.MAX_INNER_PRODUCT
+
+# On-disk layout: the raw FAISS index plus an append-only JSONL docstore, one
+# record per line in FAISS id order, so a save only writes the new chunks.
+# Older layouts (docstore.json list, FAISS.save_local's index.pkl pickle) are
+# still read and replaced by a full rewrite on the next save.
+INDEX_FILE = os.path.join(INDEX_PATH, "index.faiss")
+DOCSTORE_FILE = os.path.join(INDEX_PATH, "docstore.jsonl")
+LEGACY_DOCSTORE_FILES = [
+    os.path.join(INDEX_PATH, "docstore.json"),
+    os.path.join(INDEX_PATH, "index.pkl"),
+]
+# Docstore records already in DOCSTORE_FILE; 0 forces a full rewrite
+_persisted_docs = 0
+
+# Debounced persistence: add_documents marks the index dirty and a timer
+# writes it once, however many uploads land inside the window.
+# FAISS does not allow search concurrently with add, so readers take this
+# lock too, around the index call only (queries are embedded outside it).
+_write_lock = threading.RLock()
+_save_timer = None
+_dirty = False
+
+
+def register_change_listener(callback):
+    """Register a callback fired whenever the knowledge base contents change."""
+    _change_listeners.append(callback)
+
+
+def _notify_change():
+    for callback in _change_listeners:
+        callback()
+
+
+def _resolve_precision():
+    """Pick (backend, device, precision) from EMBEDDING_BACKEND and EMBEDDING_PRECISION."""
+    import torch
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    backend = EMBEDDING_BACKEND
+    if backend == "auto":
+        backend = "onnx" if device == "cpu" and onnx_available() else "torch"
+    if backend == "onnx":
+        return backend, "cpu", "int8"
+    precision = EMBEDDING_PRECISION
+    if precision == "auto":
+        precision = "fp16" if device == "cuda" else "int8"
+    if precision == "int8":
+        # Dynamic int8 quantization only runs on CPU
+        device = "cpu"
+    return backend, device, precision
+
+
+def _load_hf_embeddings(device: str, precision: str) -> HuggingFaceEmbeddings:
+    import torch
+    model_kwargs = {"device": device}
+    if precision == "fp16":
+        model_kwargs["model_kwargs"] = {"torch_dtype": torch.float16}
+    hf = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE, "normalize_embeddings": True}
+    )
+    if precision == "int8":
+        torch.quantization.quantize_dynamic(
+            hf.client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return hf
 
 
 def get_embeddings():
     global _embeddings
     if _embeddings is None:
-        print(f"[VectorStore] Loading embedding model: {EMBEDDING_MODEL}")
-        _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        with _embeddings_lock:
+            if _embeddings is None:
+                _embeddings = _load_embeddings()
     return _embeddings
 
 
+def _load_embeddings() -> CachedEmbeddings:
+    backend, device, precision = _resolve_precision()
+    print(f"[VectorStore] Loading embedding model: {EMBEDDING_MODEL} ({backend} {precision} on {device})")
+    if backend == "onnx":
+        model_dir = os.path.join(ONNX_MODEL_DIR, EMBEDDING_MODEL.replace("/", "__"))
+        underlying = OnnxEmbeddings(EMBEDDING_MODEL, model_dir)
+    else:
+        underlying = _load_hf_embeddings(device, precision)
+    return CachedEmbeddings(
+        underlying,
+        path=EMBED_CACHE_PATH,
+        namespace=f"{EMBEDDING_MODEL}:{backend}:{precision}:normalized"
+    )
+
+
+def embedding_window():
+    """(tokenizer, max_seq_length) of the embedding model; longer inputs are truncated."""
+    model = get_embeddings().underlying
+    # HuggingFaceEmbeddings wraps a SentenceTransformer; OnnxEmbeddings carries both itself
+    model = getattr(model, "client", model)
+    return model.tokenizer, model.max_seq_length
+
+
+def warmup_embeddings():
+    """Load the embedding model and run one forward pass (bypassing the cache)."""
+    get_embeddings().underlying.embed_query("warmup")
+
+
+def is_placeholder(doc: Document) -> bool:
+    """True for the system seed document (metadata-only check)."""
+    # Indexes saved before the "placeholder" flag only carry the source tag
+    return doc.metadata.get("placeholder", False) or doc.metadata.get("source") == "system_init"
+
+
+def _target_index_type(ntotal: int) -> str:
+    if RETRIEVER_INDEX_TYPE != "auto":
+        return RETRIEVER_INDEX_TYPE
+    if ntotal > IVFPQ_MIN_VECTORS:
+        return "ivfpq"
+    return "hnsw" if ntotal > HNSW_MIN_VECTORS else "flat"
+
+
+def _build_ivfpq(vectors: np.ndarray, metric: int):
+    """Train an IVFPQ index on the existing vectors; None if there are too few to train."""
+    n, d = vectors.shape
+    # k-means wants ~39 points per list and PQ needs 2**nbits points per codebook
+    nlist = min(IVF_NLIST, n // 39)
+    if nlist < 1 or n < 2 ** PQ_NBITS:
+        return None
+    quantizer = faiss.IndexFlat(d, metric)
+    index = faiss.IndexIVFPQ(quantizer, d, nlist, PQ_M, PQ_NBITS, metric)
+    index.train(vectors[:nlist * 256])
+    return index
+
+
+def _maybe_upgrade_index() -> bool:
+    """Rebuild the index as the type RETRIEVER_INDEX_TYPE calls for; True if it was rebuilt."""
+    index = _vectorstore.index
+    # Search-time knobs are not all persisted by write_index, so re-apply them
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+        if index.direct_map.type == faiss.DirectMap.NoMap:
+            index.make_direct_map()
+        return False
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    target = _target_index_type(index.ntotal)
+    # Only move forward: flat -> hnsw/fp16/ivfpq, hnsw -> ivfpq
+    if isinstance(index, faiss.IndexHNSW):
+        if target != "ivfpq":
+            return False
+    elif not isinstance(index, faiss.IndexFlat) or target == "flat":
+        return False
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    if target == "hnsw":
+        new_index = faiss.IndexHNSWFlat(index.d, HNSW_M, index.metric_type)
+        new_index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        new_index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif target == "fp16":
+        # Half-precision storage: halves index memory, needs no training
+        new_index = faiss.IndexScalarQuantizer(
+            index.d, faiss.ScalarQuantizer.QT_fp16, index.metric_type
+        )
+    elif target == "ivfpq":
+        new_index = _build_ivfpq(vectors, index.metric_type)
+        if new_index is None:
+            return False
+        new_index.nprobe = IVF_NPROBE
+        # Keeps reconstruct() (used by get_vector_by_docid) working
+        new_index.make_direct_map()
+    else:
+        raise ValueError(f"Unknown RETRIEVER_INDEX_TYPE: '{RETRIEVER_INDEX_TYPE}'")
+    print(f"[VectorStore] Building {target} index over {index.ntotal} vectors.")
+    # Same insertion order, so FAISS ids (and metadata["faiss_id"]) are kept
+    new_index.add(vectors)
+    _vectorstore.index = new_index
+    return True
+
+
+def _read_index_mmap(path: str):
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # faiss >= 1.9 can also map flat code arrays (flat / fp16 / HNSW storage),
+    # but not in combination with mapped IVF lists
+    mmap_ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if mmap_ifc:
+        try:
+            return faiss.read_index(path, flags | mmap_ifc)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path, flags)
+
+
+def _append_docstore(vs: FAISS):
+    """Append the docstore records added since the last save to DOCSTORE_FILE."""
+    global _persisted_docs
+    total = len(vs.index_to_docstore_id)
+    start = _persisted_docs if 0 < _persisted_docs <= total else 0
+    lines = []
+    for i in range(start, total):
+        doc_id = vs.index_to_docstore_id[i]
+        doc = vs.docstore.search(doc_id)
+        lines.append(orjson.dumps(
+            {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}
+        ))
+    with open(DOCSTORE_FILE, "ab" if start else "wb") as f:
+        f.write(b"".join(line + b"\n" for line in lines))
+    _persisted_docs = total
+    if not start:
+        for path in LEGACY_DOCSTORE_FILES:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _read_records() -> List[dict]:
+    if os.path.exists(DOCSTORE_FILE):
+        records = []
+        with open(DOCSTORE_FILE, "rb") as f:
+            for line in f:
+                try:
+                    records.append(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    # Torn final line from an interrupted append
+                    break
+        return records
+    legacy_json, legacy_pickle = LEGACY_DOCSTORE_FILES
+    if os.path.exists(legacy_json):
+        with open(legacy_json, "rb") as f:
+            return orjson.loads(f.read())
+    # Saved by FAISS.save_local before the JSON docstore; trusted local file
+    with open(legacy_pickle, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return [
+        {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}
+        for doc_id, doc in (
+            (index_to_docstore_id[i], docstore.search(index_to_docstore_id[i]))
+            for i in range(len(index_to_docstore_id))
+        )
+    ]
+
+
+def _read_docstore(ntotal: int) -> Tuple[InMemoryDocstore, Dict[int, str]]:
+    """Rebuild the docstore for an index of ntotal vectors."""
+    global _persisted_docs
+    records = _read_records()
+    # Records are appended before the index is written, so after a crash the
+    # file can only run ahead of the index; drop the extra tail.
+    if len(records) != ntotal:
+        print(f"[VectorStore] Docstore has {len(records)} records for {ntotal} vectors; "
+              f"it will be rewritten on the next save.")
+    in_sync = len(records) == ntotal and os.path.exists(DOCSTORE_FILE)
+    _persisted_docs = ntotal if in_sync else 0
+    records = records[:ntotal]
+    docstore = InMemoryDocstore({
+        r["id"]: Document(id=r["id"], page_content=r["page_content"], metadata=r["metadata"])
+        for r in records
+    })
+    return docstore, {i: r["id"] for i, r in enumerate(records)}
+
+
+def _load_saved(embeddings) -> FAISS:
+    """Read the saved index (memory-mapped if FAISS_MMAP is set) and its docstore."""
+    index = _read_index_mmap(INDEX_FILE) if FAISS_MMAP else faiss.read_index(INDEX_FILE)
+    docstore, index_to_docstore_id = _read_docstore(index.ntotal)
+    return FAISS(
+        embeddings, index, docstore, index_to_docstore_id,
+        distance_strategy=_saved_distance_strategy()
+    )
+
+
+def _saved_distance_strategy() -> DistanceStrategy:
+    """Metric recorded for the saved index (L2 for indexes predating the flag)."""
+    try:
+        with open(CONFIG_JSON_PATH, "rb") as f:
+            value = orjson.loads(f.read()).get("distance_strategy")
+    except (OSError, orjson.JSONDecodeError):
+        value = None
+    return DistanceStrategy(value) if value else DistanceStrategy.EUCLIDEAN_DISTANCE
+
+
+def _ensure_writable_index():
+    """Swap a memory-mapped (read-only) index for an in-RAM copy before mutating it."""
+    global _index_mmapped
+    if _index_mmapped:
+        print("[VectorStore] Reloading memory-mapped index into RAM for writing.")
+        _vectorstore.index = faiss.read_index(INDEX_FILE)
+        _maybe_upgrade_index()
+        _index_mmapped = False
+
+
 def initialize_vectorstore():
     """Create a fresh vectorstore with a placeholder document."""
-    global _vectorstore, _retriever
+    global _vectorstore, _retriever, _index_mmapped, _persisted_docs
     embeddings = get_embeddings()
     placeholder = Document(
         page_content="System initialized. Upload a document to get started.",
-        metadata={"source": "system_init"}
+        metadata={"source": "system_init", "placeholder": True, "faiss_id": 0}
     )
-    _vectorstore = FAISS.from_documents([placeholder], embeddings)
-    _retriever = _vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
-    save_vectorstore()
-    save_pipeline_config(total_chunks=1, init_mode="placeholder")
+    with _write_lock:
+        _vectorstore = FAISS.from_documents(
+            [placeholder], embeddings, distance_strategy=_NEW_INDEX_DISTANCE
+        )
+        _index_mmapped = False
+        _persisted_docs = 0
+        _maybe_upgrade_index()
+        _retriever = _vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
+        # The fresh index supersedes any pending write
+        _cancel_pending_save()
+        save_vectorstore()
+        save_pipeline_config(total_chunks=1, init_mode="placeholder")
+    _notify_change()
     print("[VectorStore] Initialized with placeholder document.")
     return _vectorstore
 
 
 def load_vectorstore():
     """Load an existing vectorstore from disk, or create a new one."""
-    global _vectorstore, _retriever
+    global _vectorstore, _retriever, _index_mmapped
     embeddings = get_embeddings()
+    # Held throughout so uploads never see _vectorstore and _retriever mid-swap
+    with _write_lock:
+        # Don't lose in-memory additions that haven't been written yet
+        flush_vectorstore()
 
-    if os.path.exists(INDEX_PATH):
-        print(f"[VectorStore] Loading index from: {INDEX_PATH}")
-        _vectorstore = FAISS.load_local(
-            INDEX_PATH, embeddings, allow_dangerous_deserialization=True
-        )
-        _retriever = _vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
-        print("[VectorStore] Index loaded successfully.")
-    else:
-        print("[VectorStore] No existing index found. Creating new one.")
-        initialize_vectorstore()
+        if os.path.exists(INDEX_PATH):
+            print(f"[VectorStore] Loading index from: {INDEX_PATH}" + (" (mmap)" if FAISS_MMAP else ""))
+            _vectorstore = _load_saved(embeddings)
+            if _maybe_upgrade_index():
+                # Persist the rebuild now so no later start repeats it (for
+                # IVFPQ that is k-means + PQ training over every vector)
+                save_vectorstore()
+                if FAISS_MMAP:
+                    # Map the written file instead of keeping the rebuilt copy in RAM
+                    _vectorstore.index = _read_index_mmap(INDEX_FILE)
+                    _maybe_upgrade_index()
+            _index_mmapped = FAISS_MMAP
+            _retriever = _vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
+            print("[VectorStore] Index loaded successfully.")
+        else:
+            print("[VectorStore] No existing index found. Creating new one.")
+            initialize_vectorstore()
 
-    return _vectorstore
+        return _vectorstore
 
 
 def save_vectorstore():
@@ -66,19 +389,65 @@ def save_vectorstore():
     global _vectorstore
     if _vectorstore is None:
         raise RuntimeError("Vectorstore not initialized.")
-    os.makedirs(SAVE_DIR, exist_ok=True)
-    _vectorstore.save_local(INDEX_PATH)
+    os.makedirs(INDEX_PATH, exist_ok=True)
+    # Docstore first: after a crash the index never references missing records
+    _append_docstore(_vectorstore)
+    # Write-then-rename keeps a memory-mapped reader on the old file intact
+    tmp_path = INDEX_FILE + ".tmp"
+    faiss.write_index(_vectorstore.index, tmp_path)
+    os.replace(tmp_path, INDEX_FILE)
     print(f"[VectorStore] Index saved to: {INDEX_PATH}")
 
 
+def _cancel_pending_save():
+    global _save_timer, _dirty
+    if _save_timer is not None:
+        _save_timer.cancel()
+        _save_timer = None
+    _dirty = False
+
+
+def _schedule_save():
+    global _save_timer, _dirty
+    _dirty = True
+    if _save_timer is None:
+        _save_timer = threading.Timer(SAVE_DEBOUNCE_S, flush_vectorstore)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def flush_vectorstore():
+    """Write pending changes to disk now (no-op when nothing changed)."""
+    with _write_lock:
+        if not _dirty:
+            return
+        _cancel_pending_save()
+        save_vectorstore()
+
+
+atexit.register(flush_vectorstore)
+
+
 def add_documents(chunks):
-    """Add document chunks to the vectorstore and update retriever."""
-    global _vectorstore, _retriever
-    if _vectorstore is None:
-        load_vectorstore()
-    _vectorstore.add_documents(chunks)
-    save_vectorstore()
-    _retriever = _vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
+    """Add document chunks to the vectorstore."""
+    # Waits for (rather than repeats) a load already running, e.g. the startup warm-up
+    get_vectorstore()
+    # One batched embed_documents call for the whole upload
+    texts = [c.page_content for c in chunks]
+    vectors = get_embeddings().embed_documents(texts)
+    with _write_lock:
+        _ensure_writable_index()
+        # Record each chunk's position in the FAISS index so its vector can be
+        # reconstructed later without re-embedding.
+        start = _vectorstore.index.ntotal
+        for i, chunk in enumerate(chunks):
+            chunk.metadata["faiss_id"] = start + i
+        metadatas = [c.metadata for c in chunks]
+        _vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+        _maybe_upgrade_index()
+        _schedule_save()
+    # The retriever wraps this same FAISS object, so it already sees the new chunks
+    _notify_change()
     return len(chunks)
 
 
@@ -89,19 +458,57 @@ def clear_vectorstore():
 
 
 def get_retriever():
-    global _retriever
     if _retriever is None:
-        load_vectorstore()
+        with _write_lock:
+            if _retriever is None:
+                load_vectorstore()
     return _retriever
 
 
+async def aembed_query(query: str):
+    """Embed a query in a worker thread."""
+    return await asyncio.to_thread(get_embeddings().embed_query, query)
+
+
+def retrieve(query: str, k: int = RETRIEVER_K) -> List[Document]:
+    """Retrieve the top-k chunks for a query (same results as the retriever)."""
+    get_vectorstore()
+    q_emb = get_embeddings().embed_query(query)
+    with _write_lock:
+        return _vectorstore.similarity_search_by_vector(q_emb, k=k)
+
+
+def batch_retrieve(queries: List[str], k: int = RETRIEVER_K) -> List[List[Document]]:
+    """Retrieve the top-k chunks for many queries with a single FAISS search."""
+    if not queries:
+        return []
+    get_vectorstore()
+    q_embs = np.asarray(get_embeddings().embed_documents(queries), dtype=np.float32)
+    with _write_lock:
+        vs = _vectorstore
+        _, ids = vs.index.search(q_embs, k)
+        # FAISS pads with -1 when fewer than k results exist
+        return [
+            [vs.docstore.search(vs.index_to_docstore_id[j]) for j in row if j >= 0]
+            for row in ids
+        ]
+
+
 def get_vectorstore():
-    global _vectorstore
     if _vectorstore is None:
-        load_vectorstore()
+        with _write_lock:
+            if _vectorstore is None:
+                load_vectorstore()
     return _vectorstore
 
 
+def get_vector_by_docid(faiss_id: int) -> np.ndarray:
+    """Return the stored vector for a chunk, using its metadata["faiss_id"]."""
+    get_vectorstore()
+    with _write_lock:
+        return _vectorstore.index.reconstruct(int(faiss_id))
+
+
 def save_pipeline_config(total_chunks=1, init_mode="placeholder"):
     """Save pipeline configuration to JSON."""
     os.makedirs(SAVE_DIR, exist_ok=True)
@@ -113,7 +520,10 @@ def save_pipeline_config(total_chunks=1, init_mode="placeholder"):
         "retriever_k": RETRIEVER_K,
         "total_chunks": total_chunks,
         "init_mode": init_mode,
+        "distance_strategy": (
+            _vectorstore.distance_strategy if _vectorstore is not None else _NEW_INDEX_DISTANCE
+        ).value,
         "provider": "groq"
     }
-    with open(CONFIG_JSON_PATH, "w") as f:
-        json.dump(config, f, indent=2)
+    with open(CONFIG_JSON_PATH, "wb") as f:
+        f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))